@@ -3,18 +3,24 @@
 RFID Cloud API - Central Configuration & Device Management
 Zero .env on client devices - All config comes from cloud
 """
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, Query, status, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime, timezone, timedelta
 from contextlib import asynccontextmanager
+import asyncio
 import hashlib
 import secrets
 import logging
 import os
+import time
 import jwt
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 
@@ -36,15 +42,31 @@ logger = logging.getLogger(__name__)
 # Configuration from environment
 MONGO_URL = os.environ.get('MONGO_URL')
 DB_NAME = os.environ.get('DB_NAME', 'rfid_cloud')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '200'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
 JWT_SECRET = os.environ.get('JWT_SECRET', secrets.token_hex(32))
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = int(os.environ.get('JWT_EXPIRATION_HOURS', '24'))
 ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY', secrets.token_hex(32))
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', '5'))
+DEVICE_CACHE_TTL = float(os.environ.get('DEVICE_CACHE_TTL', '30'))
 
 # Database client
 db_client: AsyncIOMotorClient = None
 db = None
 
+# Fire-and-forget bookkeeping writes still in flight
+background_tasks: set[asyncio.Task] = set()
+
+# device_id -> monotonic time it was last confirmed registered and not revoked
+verified_devices: dict[str, float] = {}
+
+# device_id -> monotonic time of its last revocation; checks started earlier aren't cached
+revoked_devices: dict[str, float] = {}
+
+# (monotonic time computed, response) for /api/admin/statistics
+statistics_cache: Optional[tuple[float, dict]] = None
+
 security = HTTPBearer()
 
 
@@ -53,9 +75,18 @@ security = HTTPBearer()
 async def lifespan(app: FastAPI):
     global db_client, db
     try:
-        db_client = AsyncIOMotorClient(MONGO_URL)
+        db_client = AsyncIOMotorClient(
+            MONGO_URL,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=60000,
+            waitQueueTimeoutMS=2500,
+            serverSelectionTimeoutMS=3000
+        )
         db = db_client[DB_NAME]
-        await db.command('ping')
+        # Concurrent pings open minPoolSize connections up front so the
+        # first burst of requests doesn't queue on connection setup
+        await asyncio.gather(*(db.command('ping') for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
         logger.info(f"✅ Connected to MongoDB: {DB_NAME}")
         
         # Create indexes
@@ -63,9 +94,16 @@ async def lifespan(app: FastAPI):
         await db.devices.create_index("mac_address", unique=True)
         await db.tokens.create_index("device_id")
         await db.tokens.create_index("expires_at", expireAfterSeconds=0)
-        await db.rfid_readings.create_index([("timestamp", -1)])
-        await db.rfid_readings.create_index("device_id")
-        await db.rfid_readings.create_index("epc")
+        # Match /api/readings query shapes: optional equality filter, newest first
+        await db.rfid_readings.create_index([("timestamp", -1), ("_id", -1)])
+        await db.rfid_readings.create_index([("device_id", 1), ("timestamp", -1), ("_id", -1)])
+        await db.rfid_readings.create_index([("epc", 1), ("timestamp", -1), ("_id", -1)])
+        await db.rfid_readings.create_index("received_at")
+        # Single-field indexes superseded by the compound ones above; they only cost writes
+        existing_indexes = await db.rfid_readings.index_information()
+        for name in ("timestamp_-1", "device_id_1", "epc_1"):
+            if name in existing_indexes:
+                await db.rfid_readings.drop_index(name)
         logger.info("✅ Database indexes created")
         
     except Exception as e:
@@ -74,6 +112,10 @@ async def lifespan(app: FastAPI):
     
     yield
     
+    # Let pending token inserts and device updates finish before the client goes away
+    if background_tasks:
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+    
     if db_client:
         db_client.close()
 
@@ -82,7 +124,8 @@ app = FastAPI(
     title="RFID Cloud API",
     description="Central configuration and device management for RFID IoT devices",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS
@@ -101,6 +144,9 @@ class DeviceRegister(BaseModel):
     device_name: Optional[str] = Field(None, description="Friendly device name")
     location: Optional[str] = Field(None, description="Physical location")
 
+class DeviceRegisterBatch(BaseModel):
+    devices: List[DeviceRegister] = Field(..., max_length=500, description="Devices to register (at most 500)")
+
 class DeviceConfig(BaseModel):
     rabbitmq_host: str = Field(..., description="RabbitMQ server host")
     rabbitmq_port: int = Field(5672, description="RabbitMQ server port")
@@ -113,6 +159,8 @@ class DeviceConfig(BaseModel):
     cache_ttl: int = Field(300, description="Local cache TTL in seconds")
     offline_mode_enabled: bool = Field(True, description="Enable offline operation")
     max_offline_readings: int = Field(10000, description="Max readings to cache offline")
+    aggregation_window: float = Field(0, description="Seconds to aggregate repeated tag reads into one message (0 disables)")
+    readings_log_sample: float = Field(0, description="Fraction of readings logged at INFO level (all are logged at DEBUG)")
 
 class DeviceResponse(BaseModel):
     device_id: str
@@ -124,6 +172,9 @@ class DeviceResponse(BaseModel):
     last_seen: Optional[str]
     is_revoked: bool
 
+# Fetch only the fields DeviceResponse needs, not heartbeat telemetry and counters
+DEVICE_RESPONSE_PROJECTION = {"_id": 0, **{field: 1 for field in DeviceResponse.model_fields}}
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -142,6 +193,9 @@ class RFIDReading(BaseModel):
     antenna: int
     rssi: float
 
+# Stored reading fields returned by /api/readings (_id is kept for the page cursor)
+READING_PROJECTION = {field: 1 for field in (*RFIDReading.model_fields, "received_at")}
+
 class RFIDReadingBatch(BaseModel):
     readings: List[RFIDReading]
 
@@ -180,13 +234,24 @@ async def verify_device_token(credentials: HTTPAuthorizationCredentials = Depend
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         device_id = payload.get("device_id")
         
+        # Devices call in on every heartbeat and batch; skip the lookup if
+        # this device was confirmed active within DEVICE_CACHE_TTL
+        verified_at = verified_devices.get(device_id)
+        if verified_at is not None and time.monotonic() - verified_at < DEVICE_CACHE_TTL:
+            return payload
+        
         # Check if device exists and is not revoked
-        device = await db.devices.find_one({"device_id": device_id})
-        if not device:
+        checked_at = time.monotonic()
+        device = await db.devices.find_one({"device_id": device_id}, {"_id": 0, "is_revoked": 1})
+        # The projection is {} for a device without is_revoked, so test for None
+        if device is None:
             raise HTTPException(status_code=401, detail="Device not found")
         if device.get("is_revoked", False):
             raise HTTPException(status_code=401, detail="Device has been revoked")
         
+        # A revoke that landed while we were reading may not be reflected above
+        if checked_at > revoked_devices.get(device_id, 0.0):
+            verified_devices[device_id] = checked_at
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -194,6 +259,20 @@ async def verify_device_token(credentials: HTTPAuthorizationCredentials = Depend
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+def run_in_background(coro, description: str):
+    """Schedule a bookkeeping write without making the response wait for it"""
+    task = asyncio.create_task(coro)
+    # The event loop only keeps weak references to tasks
+    background_tasks.add(task)
+    
+    def on_done(t: asyncio.Task):
+        background_tasks.discard(t)
+        if not t.cancelled() and t.exception():
+            logger.error(f"Background {description} failed: {t.exception()}")
+    
+    task.add_done_callback(on_done)
+
+
 async def verify_admin_key(request: Request):
     """Verify admin API key from header"""
     api_key = request.headers.get("X-Admin-API-Key")
@@ -252,12 +331,12 @@ async def authenticate_device(auth: DeviceAuth):
     token, expires = create_jwt_token(auth.device_id, auth.mac_address)
     
     # Store token info
-    await db.tokens.insert_one({
+    run_in_background(db.tokens.insert_one({
         "device_id": auth.device_id,
         "token_hash": hashlib.sha256(token.encode()).hexdigest(),
         "created_at": datetime.now(timezone.utc),
         "expires_at": expires
-    })
+    }), "token record insert")
     
     # Update last seen
     await db.devices.update_one(
@@ -282,12 +361,12 @@ async def refresh_token(device_info: dict = Depends(verify_device_token)):
     
     token, expires = create_jwt_token(device_id, mac_address)
     
-    await db.tokens.insert_one({
+    run_in_background(db.tokens.insert_one({
         "device_id": device_id,
         "token_hash": hashlib.sha256(token.encode()).hexdigest(),
         "created_at": datetime.now(timezone.utc),
         "expires_at": expires
-    })
+    }), "token record insert")
     
     return TokenResponse(
         access_token=token,
@@ -327,16 +406,18 @@ async def get_device_config(device_info: dict = Depends(verify_device_token)):
             "heartbeat_interval": 60,
             "cache_ttl": 300,
             "offline_mode_enabled": True,
-            "max_offline_readings": 10000
+            "max_offline_readings": 10000,
+            "aggregation_window": 0,
+            "readings_log_sample": 0
         }
         await db.device_configs.insert_one(default_config)
         config = default_config
     
     # Update last config fetch time
-    await db.devices.update_one(
+    run_in_background(db.devices.update_one(
         {"device_id": device_id},
         {"$set": {"last_config_fetch": datetime.now(timezone.utc).isoformat()}}
-    )
+    ), "last_config_fetch update")
     
     return DeviceConfig(
         rabbitmq_host=config["rabbitmq_host"],
@@ -349,7 +430,9 @@ async def get_device_config(device_info: dict = Depends(verify_device_token)):
         heartbeat_interval=config.get("heartbeat_interval", 60),
         cache_ttl=config.get("cache_ttl", 300),
         offline_mode_enabled=config.get("offline_mode_enabled", True),
-        max_offline_readings=config.get("max_offline_readings", 10000)
+        max_offline_readings=config.get("max_offline_readings", 10000),
+        aggregation_window=config.get("aggregation_window", 0),
+        readings_log_sample=config.get("readings_log_sample", 0)
     )
 
 
@@ -359,26 +442,29 @@ async def submit_readings(batch: RFIDReadingBatch, device_info: dict = Depends(v
     """Submit RFID readings to cloud"""
     device_id = device_info["device_id"]
     
-    readings_to_insert = []
-    for reading in batch.readings:
-        readings_to_insert.append({
+    received_at = datetime.now(timezone.utc).isoformat()
+    readings_to_insert = [
+        {
             "timestamp": reading.timestamp,
             "device_id": device_id,
             "mac_address": reading.mac_address,
             "epc": reading.epc,
             "antenna": reading.antenna,
             "rssi": reading.rssi,
-            "received_at": datetime.now(timezone.utc).isoformat()
-        })
+            "received_at": received_at
+        }
+        for reading in batch.readings
+    ]
     
     if readings_to_insert:
         await db.rfid_readings.insert_many(readings_to_insert)
     
-    # Update device stats
+    # Update device stats only once the readings are stored, so a failed
+    # insert doesn't inflate total_readings
     await db.devices.update_one(
         {"device_id": device_id},
         {
-            "$set": {"last_seen": datetime.now(timezone.utc).isoformat()},
+            "$set": {"last_seen": received_at},
             "$inc": {"total_readings": len(readings_to_insert)}
         }
     )
@@ -392,10 +478,16 @@ async def get_readings(
     epc: Optional[str] = None,
     start: Optional[str] = None,
     end: Optional[str] = None,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
+    before_timestamp: Optional[str] = None,
+    before_id: Optional[str] = None,
     device_info: dict = Depends(verify_device_token)
 ):
-    """Get RFID readings with filters"""
+    """
+    Get RFID readings with filters, newest first.
+    Pass the previous response's next_cursor as before_timestamp/before_id
+    to fetch the following page.
+    """
     query = {}
     
     if device_id:
@@ -410,10 +502,32 @@ async def get_readings(
         else:
             query["timestamp"] = {"$lte": end}
     
-    cursor = db.rfid_readings.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit)
-    readings = await cursor.to_list(length=limit)
-    
-    return {"readings": readings, "count": len(readings)}
+    # Keyset pagination: seek past the last (timestamp, _id) seen instead of skipping
+    if before_id and not before_timestamp:
+        raise HTTPException(status_code=400, detail="before_id requires before_timestamp")
+    if before_timestamp:
+        page_filter = [{"timestamp": {"$lt": before_timestamp}}]
+        if before_id:
+            try:
+                page_filter.append({"timestamp": before_timestamp, "_id": {"$lt": ObjectId(before_id)}})
+            except InvalidId:
+                raise HTTPException(status_code=400, detail="Invalid before_id")
+        query["$or"] = page_filter
+    
+    # Fetch one extra row to learn whether another page exists, instead of counting
+    cursor = db.rfid_readings.find(query, READING_PROJECTION).sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1)
+    readings = await cursor.to_list(length=limit + 1)
+    has_more = len(readings) > limit
+    del readings[limit:]
+    
+    next_cursor = None
+    if has_more:
+        last = readings[-1]
+        next_cursor = {"timestamp": last["timestamp"], "id": str(last["_id"])}
+    for reading in readings:
+        del reading["_id"]
+    
+    return {"readings": readings, "count": len(readings), "has_more": has_more, "next_cursor": next_cursor}
 
 
 # ==================== HEARTBEAT (Authenticated) ====================
@@ -479,10 +593,72 @@ async def register_device(device: DeviceRegister, _: bool = Depends(verify_admin
     )
 
 
+@app.post("/api/admin/devices/register/bulk", tags=["Admin"])
+async def register_devices_bulk(batch: DeviceRegisterBatch, _: bool = Depends(verify_admin_key)):
+    """
+    Register many devices in one round-trip (Admin only).
+    Devices that are already registered are skipped.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    # Keyed by the stored (uppercased) MAC so case variants in one batch collapse
+    device_docs = {}
+    for device in batch.devices:
+        mac_address = device.mac_address.upper()
+        device_docs.setdefault(mac_address, {
+            "device_id": generate_device_id(device.mac_address),
+            "mac_address": mac_address,
+            "device_name": device.device_name,
+            "location": device.location,
+            "status": "registered",
+            "registered_at": now,
+            "last_seen": None,
+            "is_revoked": False,
+            "total_readings": 0
+        })
+    
+    cursor = db.devices.find(
+        {"$or": [
+            {"mac_address": {"$in": list(device_docs)}},
+            {"device_id": {"$in": [d["device_id"] for d in device_docs.values()]}}
+        ]},
+        {"_id": 0, "device_id": 1, "mac_address": 1}
+    )
+    existing = await cursor.to_list(length=None)
+    existing_ids = {d["device_id"] for d in existing}
+    existing_macs = {d["mac_address"] for d in existing}
+    
+    registered, skipped = [], []
+    for mac_address, doc in device_docs.items():
+        if mac_address in existing_macs or doc["device_id"] in existing_ids:
+            skipped.append(doc["device_id"])
+        else:
+            registered.append(doc)
+    
+    if registered:
+        try:
+            # insert_many mutates the documents with _id, so hand it copies
+            await db.devices.insert_many([dict(d) for d in registered], ordered=False)
+        except BulkWriteError as e:
+            # Duplicates registered concurrently are skipped; other failures are real errors
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            duplicates = {err["index"] for err in errors}
+            skipped += [registered[i]["device_id"] for i in sorted(duplicates)]
+            registered = [d for i, d in enumerate(registered) if i not in duplicates]
+    
+    logger.info(f"✅ Bulk registered {len(registered)} devices ({len(skipped)} already registered)")
+    
+    return {
+        "registered": [DeviceResponse(**d) for d in registered],
+        "skipped": skipped
+    }
+
+
 @app.get("/api/admin/devices", response_model=List[DeviceResponse], tags=["Admin"])
 async def list_devices(_: bool = Depends(verify_admin_key)):
     """List all registered devices (Admin only)"""
-    cursor = db.devices.find({}, {"_id": 0})
+    cursor = db.devices.find({}, DEVICE_RESPONSE_PROJECTION)
     devices = await cursor.to_list(length=1000)
     return [DeviceResponse(**d) for d in devices]
 
@@ -490,7 +666,7 @@ async def list_devices(_: bool = Depends(verify_admin_key)):
 @app.get("/api/admin/devices/{device_id}", response_model=DeviceResponse, tags=["Admin"])
 async def get_device(device_id: str, _: bool = Depends(verify_admin_key)):
     """Get device details (Admin only)"""
-    device = await db.devices.find_one({"device_id": device_id}, {"_id": 0})
+    device = await db.devices.find_one({"device_id": device_id}, DEVICE_RESPONSE_PROJECTION)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     return DeviceResponse(**device)
@@ -512,6 +688,9 @@ async def revoke_device(device_id: str, _: bool = Depends(verify_admin_key)):
     
     # Invalidate all tokens for this device
     await db.tokens.delete_many({"device_id": device_id})
+    # Recorded after the update so in-flight checks that read the old state don't re-cache it
+    revoked_devices[device_id] = time.monotonic()
+    verified_devices.pop(device_id, None)
     
     logger.info(f"🚫 Device revoked: {device_id}")
     return {"status": "revoked", "device_id": device_id}
@@ -555,20 +734,35 @@ async def update_device_config(device_id: str, config: DeviceConfig, _: bool = D
 @app.get("/api/admin/statistics", tags=["Admin"])
 async def get_statistics(_: bool = Depends(verify_admin_key)):
     """Get system statistics (Admin only)"""
-    total_devices = await db.devices.count_documents({})
-    online_devices = await db.devices.count_documents({"status": "online"})
-    revoked_devices = await db.devices.count_documents({"is_revoked": True})
-    total_readings = await db.rfid_readings.count_documents({})
+    global statistics_cache
+    
+    # Dashboards poll this; serve a recent result instead of rescanning collections
+    if statistics_cache and time.monotonic() - statistics_cache[0] < STATS_CACHE_TTL:
+        return statistics_cache[1]
     
-    # Readings in last 24h
     yesterday = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
-    readings_24h = await db.rfid_readings.count_documents({"received_at": {"$gte": yesterday}})
     
-    return {
+    # Device counts in one pass; the reading total comes from collection
+    # metadata rather than a scan of every reading
+    device_counts, total_readings, readings_24h = await asyncio.gather(
+        db.devices.aggregate([
+            {"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "online": {"$sum": {"$cond": [{"$eq": ["$status", "online"]}, 1, 0]}},
+                "revoked": {"$sum": {"$cond": [{"$eq": ["$is_revoked", True]}, 1, 0]}}
+            }}
+        ]).to_list(length=1),
+        db.rfid_readings.estimated_document_count(),
+        db.rfid_readings.count_documents({"received_at": {"$gte": yesterday}})
+    )
+    devices = device_counts[0] if device_counts else {"total": 0, "online": 0, "revoked": 0}
+    
+    statistics = {
         "devices": {
-            "total": total_devices,
-            "online": online_devices,
-            "revoked": revoked_devices
+            "total": devices["total"],
+            "online": devices["online"],
+            "revoked": devices["revoked"]
         },
         "readings": {
             "total": total_readings,
@@ -576,6 +770,9 @@ async def get_statistics(_: bool = Depends(verify_admin_key)):
         },
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
+    statistics_cache = (time.monotonic(), statistics)
+    
+    return statistics
 
 
 if __name__ == "__main__":
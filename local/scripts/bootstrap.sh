@@ -66,8 +66,8 @@ check_dependencies() {
 install_python_deps() {
     echo -e "${YELLOW}Installing Python dependencies...${NC}"
     
-    pip3 install --user requests pika PyJWT >/dev/null 2>&1 || \
-    pip3 install requests pika PyJWT >/dev/null 2>&1
+    pip3 install --user requests pika PyJWT inotify_simple orjson >/dev/null 2>&1 || \
+    pip3 install requests pika PyJWT inotify_simple orjson >/dev/null 2>&1
     
     echo -e "${GREEN}✅ Python dependencies installed${NC}"
 }
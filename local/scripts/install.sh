@@ -64,11 +64,15 @@ pip install \
     pika \
     PyJWT \
     pyserial \
+    inotify_simple \
+    orjson \
     RPi.GPIO 2>/dev/null || pip install \
     requests \
     pika \
     PyJWT \
-    pyserial
+    pyserial \
+    inotify_simple \
+    orjson
 
 deactivate
 
@@ -122,6 +126,11 @@ cp "$LOCAL_DIR/scripts/start.sh" /opt/rfid/scripts/ 2>/dev/null || true
 
 chmod +x /opt/rfid/scripts/*.sh
 
+# Low USB-serial latency for the reader (sysfs is root-only)
+sudo cp "$LOCAL_DIR/config/99-rfid-ftdi-latency.rules" /etc/udev/rules.d/
+sudo udevadm control --reload-rules
+sudo udevadm trigger --subsystem-match=usb-serial --action=add
+
 echo -e "${GREEN}✅ Files installed${NC}"
 
 # ============================================================
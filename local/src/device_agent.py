@@ -7,24 +7,49 @@ import os
 import sys
 import time
 import json
+import random
 import signal
 import hashlib
 import logging
 import threading
+from collections import Counter, deque
 from datetime import datetime, timezone
 from typing import Optional
 from dataclasses import dataclass
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
 import pika
 
+# orjson encodes straight to bytes, several times faster than json
+try:
+    from orjson import dumps
+except ImportError:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+# inotify lets the log tail sleep until the reader appends; fall back to polling
+try:
+    from inotify_simple import INotify, flags
+    INOTIFY_AVAILABLE = True
+    LOG_WATCH_FLAGS = flags.MODIFY | flags.MOVE_SELF | flags.DELETE_SELF | flags.ATTRIB
+except ImportError:
+    INOTIFY_AVAILABLE = False
+
 # ==================== CONSTANTS ====================
 DEVICE_ID_FILE = "/etc/rfid/device_id"
 CONFIG_CACHE_FILE = "/var/cache/rfid/config.enc"
 READINGS_CACHE_FILE = "/var/cache/rfid/readings.json"
 LOG_FILE = "/var/log/rfid/agent.log"
 RFID_LOG_FILE = "/var/log/rfid/cm710-4.log"
+LOG_READ_CHUNK = 65536         # bytes read from the RFID log per syscall
+PUBLISH_BATCH_SIZE = 32        # readings per publish transaction
+PUBLISH_FLUSH_INTERVAL = 0.2   # seconds before a partial batch is published
+PUBLISH_QUEUE_SIZE = 10000     # readings buffered for the publisher before dropping the oldest
+RECONNECT_BASE_DELAY = 0.5     # seconds; RabbitMQ reconnect backoff doubles from here...
+RECONNECT_MAX_DELAY = 30       # ...up to this cap, with full jitter
+CACHE_SAVE_EVERY = 100  # cached readings between saves (also saved on the publisher's 10 s maintenance tick)
 
 # Cloud API URL - ONLY hardcoded value allowed
 CLOUD_API_URL = os.environ.get('RFID_CLOUD_URL', 'https://your-cloud-server.com')
@@ -61,6 +86,8 @@ class DeviceConfig:
     cache_ttl: int
     offline_mode_enabled: bool
     max_offline_readings: int
+    aggregation_window: float
+    readings_log_sample: float
     
     @classmethod
     def from_dict(cls, data: dict) -> 'DeviceConfig':
@@ -75,7 +102,9 @@ class DeviceConfig:
             heartbeat_interval=data.get('heartbeat_interval', 60),
             cache_ttl=data.get('cache_ttl', 300),
             offline_mode_enabled=data.get('offline_mode_enabled', True),
-            max_offline_readings=data.get('max_offline_readings', 10000)
+            max_offline_readings=data.get('max_offline_readings', 10000),
+            aggregation_window=data.get('aggregation_window', 0),
+            readings_log_sample=data.get('readings_log_sample', 0)
         )
 
 
@@ -105,6 +134,30 @@ class RFIDDeviceAgent:
         self.running = True
         self.offline_mode = False
         self.cached_readings = []
+        self._unsaved_readings = 0
+        # Filled by the log tail, drained by the publisher thread
+        self._publish_queue = deque(maxlen=PUBLISH_QUEUE_SIZE)
+        self._publish_ready = threading.Event()
+        self._publisher_stop = threading.Event()
+        self._publisher_thread: Optional[threading.Thread] = None
+        self._reconnect_attempts = 0
+        self._reconnect_at = 0.0
+        self._props = pika.BasicProperties(
+            delivery_mode=2,
+            content_type='application/json'
+        )
+        self.stats = {'total_processed': 0, 'published': 0, 'cached': 0, 'dropped': 0, 'by_antenna': Counter()}
+        # (epc, antenna) -> [first_reading, count, rssi_sum, rssi_min, rssi_max]
+        self._agg = {}
+        self._agg_started = 0.0
+        self._last_rotation_check = 0.0
+        self._system_files = {}
+        
+        # Keep-alive HTTP pool shared by the main and heartbeat threads so
+        # each cloud call reuses an open connection instead of a new TLS handshake
+        self.http = requests.Session()
+        self.http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
         
         # Setup signal handlers
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -120,15 +173,15 @@ class RFIDDeviceAgent:
             # Try eth0 first, then wlan0
             for interface in ['eth0', 'wlan0', 'enp0s3']:
                 path = f'/sys/class/net/{interface}/address'
-                if os.path.exists(path):
+                try:
                     with open(path, 'r') as f:
                         return f.read().strip().upper()
+                except FileNotFoundError:
+                    continue
             
             # Fallback to uuid
             import uuid
-            mac = ':'.join(['{:02x}'.format((uuid.getnode() >> i) & 0xff) 
-                          for i in range(0, 48, 8)][::-1]).upper()
-            return mac
+            return ':'.join(f'{b:02X}' for b in uuid.getnode().to_bytes(6, 'big'))
         except Exception as e:
             logger.error(f"Failed to get MAC address: {e}")
             raise
@@ -150,7 +203,7 @@ class RFIDDeviceAgent:
         try:
             logger.info("🔐 Authenticating with cloud...")
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.cloud_url}/api/devices/authenticate",
                 json={
                     "device_id": self.device_id,
@@ -180,7 +233,7 @@ class RFIDDeviceAgent:
         try:
             logger.info("🔄 Refreshing token...")
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.cloud_url}/api/devices/refresh-token",
                 headers={"Authorization": f"Bearer {self.access_token}"},
                 timeout=30
@@ -207,7 +260,7 @@ class RFIDDeviceAgent:
         try:
             logger.info("📥 Fetching configuration from cloud...")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.cloud_url}/api/config",
                 headers={"Authorization": f"Bearer {self.access_token}"},
                 timeout=30
@@ -295,17 +348,11 @@ class RFIDDeviceAgent:
                 virtual_host=self.config.rabbitmq_vhost,
                 credentials=credentials,
                 heartbeat=600,
-                blocked_connection_timeout=300,
-                connection_attempts=3,
-                retry_delay=5
+                blocked_connection_timeout=300
             )
             
             self.rabbitmq_connection = pika.BlockingConnection(parameters)
-            self.rabbitmq_channel = self.rabbitmq_connection.channel()
-            
-            # Declare queue
-            self.queue_name = f"{self.config.queue_prefix}{self.device_id}"
-            self.rabbitmq_channel.queue_declare(queue=self.queue_name, durable=True)
+            self._open_channel()
             
             logger.info(f"✅ RabbitMQ connected, queue: {self.queue_name}")
             return True
@@ -314,28 +361,124 @@ class RFIDDeviceAgent:
             logger.error(f"❌ RabbitMQ connection failed: {e}")
             return False
     
-    def publish_reading(self, reading: dict) -> bool:
-        """Publish RFID reading to RabbitMQ"""
+    def _reconnect_rabbitmq(self):
+        """Reconnect, scheduling the next attempt with exponential backoff on failure"""
+        self._reconnect_attempts += 1
+        logger.warning(f"🔄 RabbitMQ disconnected, reconnecting (attempt {self._reconnect_attempts})...")
+        if self.connect_rabbitmq():
+            self._reconnect_attempts = 0
+            return
+        
+        # Full jitter spreads out agents that lost the broker at the same time
+        backoff = RECONNECT_BASE_DELAY * 2 ** min(self._reconnect_attempts, 16)
+        self._reconnect_at = time.monotonic() + random.uniform(0, min(RECONNECT_MAX_DELAY, backoff))
+    
+    def _open_channel(self):
+        """Open a publishing channel on the current connection"""
+        self.rabbitmq_channel = self.rabbitmq_connection.channel()
+        
+        # Declare queue; channel state does not survive a reopen, so this runs every time
+        self.queue_name = f"{self.config.queue_prefix}{self.device_id}"
+        self.rabbitmq_channel.queue_declare(queue=self.queue_name, durable=True)
+        
+        # Publishes are committed in batches (see _publish_batch)
+        self.rabbitmq_channel.tx_select()
+    
+    def publish_reading(self, reading: dict):
+        """Hand a reading to the publisher thread without waiting on RabbitMQ"""
+        queue = self._publish_queue
+        if len(queue) == queue.maxlen:
+            # Publisher is stalled (e.g. broker blocked); the deque evicts the oldest
+            self.stats['dropped'] += 1
+        queue.append(reading)
+        if len(queue) >= PUBLISH_BATCH_SIZE:
+            self._publish_ready.set()
+    
+    def flush_publishes(self):
+        """Publish queued readings in batches, caching them on failure"""
+        queue = self._publish_queue
+        while queue:
+            batch = []
+            try:
+                while len(batch) < PUBLISH_BATCH_SIZE:
+                    batch.append(queue.popleft())
+            except IndexError:
+                pass
+            
+            success = self._publish_batch(batch)
+            for reading in batch:
+                self._record_reading(reading, success)
+    
+    def publisher_loop(self):
+        """Background thread owning the RabbitMQ connection and offline cache"""
+        last_maintenance = 0
+        last_sync = 0
+        
+        # Runs until shutdown, after the log tail has queued its last readings
+        while not self._publisher_stop.is_set() or self._publish_queue:
+            # Woken early by a full batch, otherwise flushes partial batches on timeout
+            self._publish_ready.wait(PUBLISH_FLUSH_INTERVAL)
+            self._publish_ready.clear()
+            self.flush_publishes()
+            
+            # Reconnect RabbitMQ if needed, including when the first connect failed
+            if self.rabbitmq_connection is None or self.rabbitmq_connection.is_closed:
+                if time.monotonic() >= self._reconnect_at:
+                    self._reconnect_rabbitmq()
+            
+            now = time.time()
+            if now - last_maintenance < 10:
+                continue
+            last_maintenance = now
+            
+            if self.rabbitmq_channel and self.rabbitmq_channel.is_closed:
+                # A channel error (e.g. a failed commit) closes only the channel
+                logger.warning("🔄 RabbitMQ channel closed, reopening...")
+                try:
+                    self._open_channel()
+                except Exception as e:
+                    logger.error(f"❌ RabbitMQ channel reopen failed: {e}")
+            
+            # Sync cached readings
+            if now - last_sync >= 60 and self.cached_readings:
+                if not self.offline_mode:
+                    self.sync_cached_readings()
+                last_sync = now
+            
+            # Persist readings cached since the last save
+            if self._unsaved_readings:
+                self._save_cached_readings()
+    
+    def _publish_batch(self, readings: list) -> bool:
+        """Publish readings to RabbitMQ in one channel transaction"""
         try:
             if not self.rabbitmq_channel:
                 raise Exception("RabbitMQ not connected")
             
-            message = json.dumps(reading)
-            
-            self.rabbitmq_channel.basic_publish(
-                exchange='',
-                routing_key=self.queue_name,
-                body=message,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                    content_type='application/json'
+            # Queue name and properties are fixed per connection; bind them once per batch
+            basic_publish = self.rabbitmq_channel.basic_publish
+            routing_key = self.queue_name
+            props = self._props
+            for reading in readings:
+                basic_publish(
+                    exchange='',
+                    routing_key=routing_key,
+                    body=dumps(reading),
+                    properties=props
                 )
-            )
+            # A single commit round-trip confirms the whole batch
+            self.rabbitmq_channel.tx_commit()
             return True
             
         except Exception as e:
-            logger.warning(f"Failed to publish reading: {e}")
-            self._cache_reading(reading)
+            logger.warning(f"Failed to publish {len(readings)} readings: {e}")
+            try:
+                if self.rabbitmq_channel and self.rabbitmq_channel.is_open:
+                    self.rabbitmq_channel.tx_rollback()
+            except Exception as rollback_error:
+                logger.debug(f"Transaction rollback failed: {rollback_error}")
+            for reading in readings:
+                self._cache_reading(reading)
             return False
     
     def _cache_reading(self, reading: dict):
@@ -347,10 +490,15 @@ class RFIDDeviceAgent:
             self.cached_readings.pop(0)  # Remove oldest
         
         self.cached_readings.append(reading)
-        self._save_cached_readings()
+        
+        # Rewriting the whole cache file per reading is O(n) each time; batch it
+        self._unsaved_readings += 1
+        if self._unsaved_readings >= CACHE_SAVE_EVERY:
+            self._save_cached_readings()
     
     def _save_cached_readings(self):
         """Save cached readings to disk"""
+        self._unsaved_readings = 0
         try:
             cache_dir = Path(READINGS_CACHE_FILE).parent
             cache_dir.mkdir(parents=True, exist_ok=True)
@@ -377,19 +525,20 @@ class RFIDDeviceAgent:
         
         logger.info(f"🔄 Syncing {len(self.cached_readings)} cached readings...")
         
+        # Failed batches are re-cached by _publish_batch
+        pending, self.cached_readings = self.cached_readings, []
         synced = 0
-        failed = []
         
-        for reading in self.cached_readings:
-            if self.publish_reading(reading):
-                synced += 1
-            else:
-                failed.append(reading)
+        for i in range(0, len(pending), PUBLISH_BATCH_SIZE):
+            if not self._publish_batch(pending[i:i + PUBLISH_BATCH_SIZE]):
+                # Still offline; keep the rest, in order, for the next attempt
+                self.cached_readings.extend(pending[i + PUBLISH_BATCH_SIZE:])
+                break
+            synced += len(pending[i:i + PUBLISH_BATCH_SIZE])
         
-        self.cached_readings = failed
         self._save_cached_readings()
         
-        logger.info(f"✅ Synced {synced} readings, {len(failed)} remaining")
+        logger.info(f"✅ Synced {synced} readings, {len(self.cached_readings)} remaining")
     
     def send_heartbeat(self):
         """Send heartbeat to cloud"""
@@ -400,7 +549,7 @@ class RFIDDeviceAgent:
             disk_usage = self._get_disk_usage()
             uptime = self._get_uptime()
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.cloud_url}/api/heartbeat",
                 headers={"Authorization": f"Bearer {self.access_token}"},
                 json={
@@ -424,17 +573,23 @@ class RFIDDeviceAgent:
             logger.warning(f"Heartbeat error: {e}")
             self.offline_mode = True
     
+    def _read_system_file(self, path: str) -> str:
+        """Read a /proc or /sys file, keeping it open between heartbeats"""
+        f = self._system_files.get(path)
+        if f is None:
+            f = self._system_files[path] = open(path, 'r')
+        f.seek(0)
+        return f.read()
+    
     def _get_cpu_temp(self) -> Optional[float]:
         try:
-            with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                return float(f.read().strip()) / 1000
+            return float(self._read_system_file('/sys/class/thermal/thermal_zone0/temp').strip()) / 1000
         except (FileNotFoundError, ValueError, OSError):
             return None
     
     def _get_memory_usage(self) -> Optional[float]:
         try:
-            with open('/proc/meminfo', 'r') as f:
-                lines = f.readlines()
+            lines = self._read_system_file('/proc/meminfo').splitlines()
             total = int([line for line in lines if 'MemTotal' in line][0].split()[1])
             available = int([line for line in lines if 'MemAvailable' in line][0].split()[1])
             return round((1 - available/total) * 100, 1)
@@ -452,24 +607,28 @@ class RFIDDeviceAgent:
     
     def _get_uptime(self) -> Optional[int]:
         try:
-            with open('/proc/uptime', 'r') as f:
-                return int(float(f.read().split()[0]))
+            return int(float(self._read_system_file('/proc/uptime').split()[0]))
         except (FileNotFoundError, ValueError, OSError):
             return None
     
-    def parse_rfid_log_line(self, line: str) -> Optional[dict]:
-        """Parse RFID log line"""
+    def parse_rfid_log_line(self, line: bytes) -> Optional[dict]:
+        """Parse RFID log line: date time mac epc antenna rssi"""
         try:
-            parts = line.strip().split()
-            if len(parts) >= 6:
-                return {
-                    "timestamp": f"{parts[0]} {parts[1]}",
-                    "device_id": self.device_id,
-                    "mac_address": parts[2],
-                    "epc": parts[3],
-                    "antenna": int(parts[4]),
-                    "rssi": float(parts[5])
-                }
+            # Fixed field order, so locate the separators rather than split()
+            p1 = line.index(b' ')
+            p2 = line.index(b' ', p1 + 1)
+            p3 = line.index(b' ', p2 + 1)
+            p4 = line.index(b' ', p3 + 1)
+            p5 = line.index(b' ', p4 + 1)
+            return {
+                "timestamp": line[:p2].decode('ascii'),
+                "device_id": self.device_id,
+                "mac_address": line[p2 + 1:p3].decode('ascii'),
+                "epc": line[p3 + 1:p4].decode('ascii'),
+                "antenna": int(line[p4 + 1:p5]),
+                # RSSI is right-aligned, so it may carry extra leading spaces
+                "rssi": float(line[p5 + 1:])
+            }
         except Exception as e:
             logger.debug(f"Failed to parse line: {line} - {e}")
         return None
@@ -478,35 +637,222 @@ class RFIDDeviceAgent:
         """Monitor RFID log file and publish readings"""
         logger.info(f"📖 Monitoring RFID log: {RFID_LOG_FILE}")
         
-        # Wait for log file
-        while not os.path.exists(RFID_LOG_FILE) and self.running:
-            logger.info("⏳ Waiting for RFID log file...")
-            time.sleep(5)
+        from_start = False
+        try:
+            while self.running:
+                # Wait for log file
+                if not self._wait_for_file(RFID_LOG_FILE):
+                    return
+                
+                try:
+                    self._tail_log(from_start)
+                except Exception as e:
+                    # Errors are rare here (e.g. the log vanished before it was opened);
+                    # keep them out of the per-line path and just retry
+                    logger.error(f"❌ Error tailing RFID log: {e}")
+                    time.sleep(1)
+                    # The file we retry with may be a new one; don't skip what it already holds
+                    from_start = True
+                    continue
+                # The log was rotated away; its replacement is read from the start
+                from_start = True
+        finally:
+            self.flush_aggregates()
+    
+    def _wait_for_file(self, path: str) -> bool:
+        """Block until path exists; return False if shutdown came first"""
+        if os.path.exists(path):
+            return True
         
-        if not self.running:
-            return
+        logger.info("⏳ Waiting for RFID log file...")
+        if INOTIFY_AVAILABLE:
+            ino = None
+            try:
+                ino = INotify()
+                ino.add_watch(os.path.dirname(path), flags.CREATE | flags.MOVED_TO)
+                name = os.path.basename(path)
+                # It may have been created before the watch was in place
+                found = os.path.exists(path)
+                while not found and self.running:
+                    # Timeout only so shutdown is noticed
+                    found = any(e.name == name for e in ino.read(timeout=1000))
+                return found
+            except OSError as e:
+                logger.warning(f"⚠️ Cannot watch {os.path.dirname(path)}, polling instead: {e}")
+            finally:
+                if ino is not None:
+                    ino.close()
         
-        with open(RFID_LOG_FILE, 'r') as f:
-            # Seek to end
-            f.seek(0, 2)
+        while not os.path.exists(path):
+            if not self.running:
+                return False
+            time.sleep(5)
+        return True
+    
+    def _tail_log(self, from_start: bool):
+        """Publish lines appended to the log until shutdown or rotation"""
+        ino = None
+        if INOTIFY_AVAILABLE:
+            try:
+                ino = INotify()
+                ino.add_watch(RFID_LOG_FILE, LOG_WATCH_FLAGS)
+            except OSError as e:
+                # e.g. max_user_watches reached; polling still works
+                logger.warning(f"⚠️ Cannot watch RFID log, polling instead: {e}")
+                if ino is not None:
+                    ino.close()
+                    ino = None
+        
+        with open(RFID_LOG_FILE, 'rb', buffering=0) as f:
+            fd = f.fileno()
+            pos = 0 if from_start else os.lseek(fd, 0, os.SEEK_END)
+            buf = bytearray()
+            rotated = False
             
-            while self.running:
-                line = f.readline()
-                
-                if line:
-                    reading = self.parse_rfid_log_line(line)
-                    if reading:
-                        success = self.publish_reading(reading)
-                        status = "✅" if success else "📦 cached"
-                        logger.info(f"{status} EPC={reading['epc']} ANT={reading['antenna']} RSSI={reading['rssi']}")
-                else:
-                    time.sleep(0.1)
+            try:
+                while self.running:
+                    chunk = os.read(fd, LOG_READ_CHUNK)
+                    if chunk:
+                        pos += len(chunk)
+                        buf += chunk
+                        
+                        # A partial last line stays buffered for the next read
+                        start = self._drain_lines(buf)
+                        del buf[:start]
+                        
+                        if start:
+                            self._maybe_flush_aggregates()
+                        continue
+                    
+                    if os.fstat(fd).st_size < pos:
+                        logger.warning("⚠️ RFID log truncated, reading from start")
+                        pos = os.lseek(fd, 0, os.SEEK_SET)
+                        buf.clear()
+                        continue
+                    
+                    # Fully drained the old file after it was rotated away
+                    if rotated:
+                        logger.info("🔄 RFID log rotated, reopening")
+                        return
+                    
+                    self._maybe_flush_aggregates()
+                    rotated = self._wait_for_log_change(ino, fd)
+            finally:
+                if ino is not None:
+                    ino.close()
+    
+    def _wait_for_log_change(self, ino, fd: int) -> bool:
+        """Block until the log is written to; return True if it was replaced"""
+        if ino is None:
+            time.sleep(0.1)
+            # Without events, stat the path about once a second to notice rotation
+            now = time.monotonic()
+            if now - self._last_rotation_check < 1.0:
+                return False
+            self._last_rotation_check = now
+            return self._log_replaced(fd)
+        
+        # Parks the thread in the kernel until an append, with a periodic
+        # wakeup for shutdown and aggregation flushes
+        events = ino.read(timeout=1000)
+        if any(e.mask & ~flags.MODIFY for e in events):
+            return self._log_replaced(fd)
+        return False
+    
+    def _log_replaced(self, fd: int) -> bool:
+        """Whether RFID_LOG_FILE no longer refers to the open file"""
+        try:
+            return os.stat(RFID_LOG_FILE).st_ino != os.fstat(fd).st_ino
+        except FileNotFoundError:
+            return True
+    
+    def _drain_lines(self, buf: bytearray) -> int:
+        """Parse and publish every complete line in buf; return the bytes consumed"""
+        # Hot loop: bind attribute lookups to locals once per chunk
+        parse = self.parse_rfid_log_line
+        handle = self._aggregate_reading if self.config.aggregation_window > 0 else self.publish_reading
+        find = buf.find
+        
+        start = 0
+        nl = find(b'\n')
+        while nl >= 0:
+            reading = parse(buf[start:nl])
+            if reading:
+                handle(reading)
+            start = nl + 1
+            nl = find(b'\n', start)
+        return start
+    
+    def _aggregate_reading(self, reading: dict):
+        """Fold a reading into the current aggregation window"""
+        rssi = reading['rssi']
+        key = (reading['epc'], reading['antenna'])
+        agg = self._agg.get(key)
+        
+        if agg is None:
+            if not self._agg:
+                self._agg_started = time.monotonic()
+            self._agg[key] = [reading, 1, rssi, rssi, rssi]
+        else:
+            agg[1] += 1
+            agg[2] += rssi
+            if rssi < agg[3]:
+                agg[3] = rssi
+            if rssi > agg[4]:
+                agg[4] = rssi
+    
+    def _maybe_flush_aggregates(self):
+        if self._agg and time.monotonic() - self._agg_started >= self.config.aggregation_window:
+            self.flush_aggregates()
+    
+    def flush_aggregates(self):
+        """Publish one reading per (epc, antenna) seen in the current window"""
+        aggregates, self._agg = self._agg, {}
+        
+        for reading, count, rssi_sum, rssi_min, rssi_max in aggregates.values():
+            reading = dict(
+                reading,
+                rssi=round(rssi_sum / count, 1),
+                rssi_min=rssi_min,
+                rssi_max=rssi_max,
+                count=count
+            )
+            self.publish_reading(reading)
+    
+    def _record_reading(self, reading: dict, success: bool):
+        """Update reading counters, logging a summary every 100 readings"""
+        stats = self.stats
+        stats['published' if success else 'cached'] += 1
+        stats['by_antenna'][reading['antenna']] += 1
+        
+        # Per-reading lines are DEBUG only; at INFO a sampled fraction is kept for spot checks
+        sample = self.config.readings_log_sample
+        if logger.isEnabledFor(logging.DEBUG):
+            level = logging.DEBUG
+        elif sample and random.random() < sample:
+            level = logging.INFO
+        else:
+            level = None
+        if level is not None:
+            logger.log(level, "%s EPC=%s ANT=%s RSSI=%s",
+                       "✅" if success else "📦 cached",
+                       reading['epc'], reading['antenna'], reading['rssi'])
+        
+        stats['total_processed'] += 1
+        if stats['total_processed'] % 100 == 0:
+            self.log_statistics()
+    
+    def log_statistics(self):
+        """Log aggregate reading counters"""
+        by_antenna = ", ".join(f"ANT{ant}={n}" for ant, n in sorted(self.stats['by_antenna'].items()))
+        logger.info(f"📊 Readings: {self.stats['total_processed']} total, "
+                    f"{self.stats['published']} published, {self.stats['cached']} cached, "
+                    f"{self.stats['dropped']} dropped ({by_antenna})")
     
     def heartbeat_loop(self):
-        """Background thread for heartbeat and maintenance"""
+        """Background thread for heartbeat and token refresh"""
         last_heartbeat = 0
         last_token_check = 0
-        last_sync = 0
         
         while self.running:
             now = time.time()
@@ -522,17 +868,6 @@ class RFIDDeviceAgent:
                     self.refresh_token()
                 last_token_check = now
             
-            # Sync cached readings
-            if now - last_sync >= 60 and self.cached_readings:
-                if not self.offline_mode:
-                    self.sync_cached_readings()
-                last_sync = now
-            
-            # Reconnect RabbitMQ if needed
-            if self.rabbitmq_connection and self.rabbitmq_connection.is_closed:
-                logger.warning("🔄 RabbitMQ disconnected, reconnecting...")
-                self.connect_rabbitmq()
-            
             time.sleep(10)
     
     def run(self):
@@ -565,6 +900,12 @@ class RFIDDeviceAgent:
                 logger.error("❌ Failed to get configuration")
                 sys.exit(1)
         
+        # Verbosity is managed from the cloud config
+        try:
+            logging.getLogger().setLevel(self.config.log_level.upper())
+        except ValueError:
+            logger.warning(f"⚠️ Unknown log level {self.config.log_level!r}, keeping INFO")
+        
         # Load any cached readings
         self._load_cached_readings()
         
@@ -581,6 +922,10 @@ class RFIDDeviceAgent:
         heartbeat_thread = threading.Thread(target=self.heartbeat_loop, daemon=True)
         heartbeat_thread.start()
         
+        # Start publisher thread; it is the only user of the RabbitMQ connection
+        self._publisher_thread = threading.Thread(target=self.publisher_loop, daemon=True)
+        self._publisher_thread.start()
+        
         # Monitor RFID log
         try:
             self.monitor_rfid_log()
@@ -594,15 +939,31 @@ class RFIDDeviceAgent:
         logger.info("🛑 Shutting down...")
         self.running = False
         
-        # Save cached readings
-        self._save_cached_readings()
+        # Let the publisher drain what the log tail queued
+        if self._publisher_thread:
+            self._publisher_stop.set()
+            self._publish_ready.set()
+            self._publisher_thread.join(timeout=30)
         
-        # Close RabbitMQ
-        if self.rabbitmq_connection and not self.rabbitmq_connection.is_closed:
-            try:
-                self.rabbitmq_connection.close()
-            except Exception as e:
-                logger.debug(f"Error closing RabbitMQ connection: {e}")
+        if self._publisher_thread and self._publisher_thread.is_alive():
+            # Still blocked on the broker; it owns the connection and cache, so leave them
+            logger.warning(f"⚠️ Publisher did not finish, {len(self._publish_queue)} queued readings not saved")
+        else:
+            # Save cached readings
+            self._save_cached_readings()
+            
+            # Close RabbitMQ
+            if self.rabbitmq_connection and not self.rabbitmq_connection.is_closed:
+                try:
+                    self.rabbitmq_connection.close()
+                except Exception as e:
+                    logger.debug(f"Error closing RabbitMQ connection: {e}")
+        
+        self.log_statistics()
+        
+        self.http.close()
+        for f in self._system_files.values():
+            f.close()
         
         logger.info("👋 Agent stopped")
 
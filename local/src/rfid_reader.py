@@ -3,9 +3,11 @@
 RFID Reader Script for CM710-4 Module
 Runs on Raspberry Pi - reads tags and writes to log file
 """
+import binascii
+import os
 import serial
+import struct
 import time
-import glob
 import sys
 import signal
 from datetime import datetime
@@ -25,6 +27,21 @@ EN_PIN = 18          # GPIO pin for module enable
 BUZZER_PIN = 17      # GPIO pin for buzzer
 LOG_FILE = "/var/log/rfid/cm710-4.log"
 BAUD_RATE = 115200
+LOG_FLUSH_EVERY = 100       # readings buffered before forcing a flush (keep below IOV_MAX)
+LOG_FLUSH_INTERVAL = 1.0    # seconds between flushes while readings trickle in (and log reopen attempts)
+LOG_BACKLOG_MAX = 10000     # readings kept in memory while the log can't be opened
+
+# ==================== CM710-4 COMMANDS ====================
+# Continuous Inventory Label Command (0x82)
+# Frame: C8 8C 00 0A 82 00 00 88 0D 0A
+CMD_START_INVENTORY = bytes.fromhex("C88C000A820000880D0A")
+# Stop Continuous Inventory Tag (CMD 0x8C)
+# Frame: C8 8C 00 08 8C 84 0D 0A
+CMD_STOP_INVENTORY = bytes.fromhex("C88C00088C840D0A")
+
+# Inventory response field layouts: PC word, then RSSI (signed, 0.1 dBm) + antenna
+_PC = struct.Struct('>H')
+_RSSI_ANT = struct.Struct('>hB')
 
 # ==================== LOGGING ====================
 logging.basicConfig(
@@ -36,6 +53,12 @@ logger = logging.getLogger(__name__)
 # ==================== GLOBALS ====================
 running = True
 serial_port = None
+log_fd = None
+pending_records = []
+last_flush = 0.0
+last_open_attempt = 0.0
+ts_second = None
+ts_prefix = b""
 
 
 def get_mac_address():
@@ -51,15 +74,14 @@ def get_mac_address():
                 continue
         
         # Fallback to uuid method
-        mac = ':'.join(['{:02x}'.format((uuid.getnode() >> i) & 0xff) 
-                       for i in range(0, 48, 8)][::-1]).upper()
-        return mac
+        return ':'.join(f'{b:02X}' for b in uuid.getnode().to_bytes(6, 'big'))
     except Exception as e:
         logger.error(f"Failed to get MAC address: {e}")
         return "00:00:00:00:00:00"
 
 
 MAC_ADDRESS = get_mac_address()
+MAC_BYTES = MAC_ADDRESS.encode()
 
 
 def signal_handler(signum, frame):
@@ -102,7 +124,12 @@ def cleanup_gpio():
 
 def find_serial_port():
     """Find available serial port"""
-    ports = glob.glob('/dev/ttyUSB*') + glob.glob('/dev/ttyACM*')
+    # One pass over /dev instead of two glob walks; USB adapters take precedence
+    with os.scandir('/dev') as entries:
+        ports = sorted(
+            (e.path for e in entries if e.name.startswith(('ttyUSB', 'ttyACM'))),
+            key=lambda path: (not path.startswith('/dev/ttyUSB'), path)
+        )
     
     if not ports:
         logger.error("No serial port found!")
@@ -112,10 +139,37 @@ def find_serial_port():
     return ports[0]
 
 
+def set_low_latency(ser, port):
+    """Stop the USB-serial adapter from holding back short frames"""
+    # FTDI chips flush their RX buffer every latency_timer ms (default 16)
+    # when less than a USB packet is queued, which stalls each short frame
+    # Normally already set by the udev rule from install.sh, as sysfs is root-only
+    path = f"/sys/bus/usb-serial/devices/{os.path.basename(port)}/latency_timer"
+    try:
+        with open(path) as f:
+            current = f.read().strip()
+        if current != "1":
+            with open(path, "w") as f:
+                f.write("1")
+        logger.info("USB latency timer set to 1 ms")
+    except PermissionError as e:
+        # Frames stay up to 16 ms late
+        logger.warning(f"Could not set USB latency timer (install 99-rfid-ftdi-latency.rules): {e}")
+    except OSError as e:
+        # Non-FTDI adapters don't expose it
+        logger.debug(f"Could not set USB latency timer: {e}")
+    
+    try:
+        ser.set_low_latency_mode(True)
+    except (AttributeError, OSError, ValueError) as e:
+        logger.debug(f"Could not enable ASYNC_LOW_LATENCY: {e}")
+
+
 def open_serial(port):
     """Open serial connection"""
     try:
         ser = serial.Serial(port, BAUD_RATE, timeout=1.0)
+        set_low_latency(ser, port)
         ser.reset_input_buffer()
         logger.info(f"Serial port opened: {port}")
         return ser
@@ -126,19 +180,13 @@ def open_serial(port):
 
 def start_continuous_inventory(ser):
     """Send command to start continuous inventory"""
-    # Continuous Inventory Label Command (0x82)
-    # Frame: C8 8C 00 0A 82 00 00 88 0D 0A
-    cmd = bytes.fromhex("C88C000A820000880D0A")
-    ser.write(cmd)
+    ser.write(CMD_START_INVENTORY)
     logger.info("Started continuous inventory")
 
 
 def stop_continuous_inventory(ser):
     """Send command to stop continuous inventory"""
-    # Stop Continuous Inventory Tag (CMD 0x8C)
-    # Frame: C8 8C 00 08 8C 84 0D 0A
-    cmd = bytes.fromhex("C88C00088C840D0A")
-    ser.write(cmd)
+    ser.write(CMD_STOP_INVENTORY)
     logger.info("Stopped continuous inventory")
 
 
@@ -155,25 +203,126 @@ def beep():
         pass
 
 
-def log_reading(epc, antenna, rssi):
-    """Write reading to log file"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    line = f"{timestamp} {MAC_ADDRESS} {epc} {antenna} {rssi:6.1f}"
+def open_log():
+    """Open the readings log, keeping the fd until the file is rotated"""
+    global log_fd, last_flush, last_open_attempt
+    last_open_attempt = time.monotonic()
+    try:
+        log_fd = os.open(LOG_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        last_flush = last_open_attempt
+    except OSError as e:
+        log_fd = None
+        logger.error(f"Failed to open log file: {e}")
+
+
+def flush_log(force=False):
+    """Write pending records after LOG_FLUSH_EVERY readings or LOG_FLUSH_INTERVAL seconds"""
+    global last_flush
+    if not pending_records:
+        return
     
-    # Print to console
-    print(line)
+    now = time.monotonic()
+    if not (force or len(pending_records) >= LOG_FLUSH_EVERY or now - last_flush >= LOG_FLUSH_INTERVAL):
+        return
+    
+    if log_fd is None:
+        # Opening failed earlier (e.g. missing directory); keep retrying
+        if now - last_open_attempt >= LOG_FLUSH_INTERVAL:
+            open_log()
+    elif log_rotated():
+        # The agent follows rename-style rotation and waits for a new file at LOG_FILE
+        logger.info("Log file rotated, reopening")
+        os.close(log_fd)
+        open_log()
     
-    # Write to log file
+    if log_fd is None:
+        # Hold the newest records until the log can be written again
+        del pending_records[:-LOG_BACKLOG_MAX]
+        return
+    
+    # One syscall per LOG_FLUSH_EVERY records, without joining them first
     try:
-        with open(LOG_FILE, "a") as f:
-            f.write(line + "\n")
-    except Exception as e:
+        for i in range(0, len(pending_records), LOG_FLUSH_EVERY):
+            os.writev(log_fd, pending_records[i:i + LOG_FLUSH_EVERY])
+    except OSError as e:
         logger.error(f"Failed to write to log: {e}")
+    pending_records.clear()
+    last_flush = now
+
+
+def log_rotated():
+    """Whether LOG_FILE is missing or no longer the file log_fd refers to"""
+    try:
+        return os.stat(LOG_FILE).st_ino != os.fstat(log_fd).st_ino
+    except FileNotFoundError:
+        return True
+
+
+def close_log():
+    """Flush and close the readings log"""
+    global log_fd
+    flush_log(force=True)
+    if log_fd is not None:
+        os.close(log_fd)
+        log_fd = None
+
+
+def timestamp():
+    """Local time with milliseconds, formatting the date part once per second"""
+    global ts_second, ts_prefix
+    now = time.time()
+    second = int(now)
+    if second != ts_second:
+        ts_second = second
+        ts_prefix = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S").encode()
+    return b"%b.%03d" % (ts_prefix, int((now - second) * 1000))
+
+
+def log_reading(epc, antenna, rssi):
+    """Queue a reading for the log file (epc as raw bytes)"""
+    record = b"%b %b %b %d %6.1f\n" % (
+        timestamp(), MAC_BYTES, binascii.hexlify(epc).upper(), antenna, rssi
+    )
+    
+    # Echo to console only when debugging; the log file is the record
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(record.decode().rstrip())
+    
+    # Queue for the log file; the main loop flushes
+    pending_records.append(record)
     
     # Beep
     beep()
 
 
+class FrameReader:
+    """Splits the serial byte stream into CR LF terminated frames"""
+    
+    def __init__(self, ser):
+        self.s = ser
+        self.buf = bytearray()
+        self.scan_pos = 0
+    
+    def next_frame(self):
+        """Return the next complete frame, or None if the read timed out"""
+        while True:
+            idx = self.buf.find(b'\x0D\x0A', self.scan_pos)
+            if idx >= 0:
+                frame = bytes(self.buf[:idx + 2])
+                del self.buf[:idx + 2]
+                self.scan_pos = 0
+                return frame
+            
+            # Keep the last byte in range in case it is the CR of a split CR LF
+            self.scan_pos = max(0, len(self.buf) - 1)
+            
+            # Block for at least one byte so the thread sleeps in the kernel
+            data = self.s.read(max(1, min(2048, self.s.in_waiting)))
+            if not data:
+                return None
+            self.buf.extend(data)
+
+
 def parse_frame(frame):
     """Parse RFID response frame"""
     try:
@@ -185,24 +334,17 @@ def parse_frame(frame):
         if frame[4] != 0x83:  # Inventory response
             return None
         
-        i = 5
-        
         # Parse PC (Protocol Control)
-        pc = (frame[i] << 8) | frame[i + 1]
+        (pc,) = _PC.unpack_from(frame, 5)
         epc_len = ((pc >> 11) & 0x1F) * 2
-        i += 2
-        
-        # Parse EPC
-        epc = frame[i:i + epc_len].hex().upper()
-        i += epc_len
         
-        # Parse RSSI
-        rssi_raw = (frame[i] << 8) | frame[i + 1]
-        rssi = (rssi_raw - 65536) / 10.0 if rssi_raw > 32767 else rssi_raw / 10.0
-        i += 2
+        # Parse EPC, kept as bytes until it is logged
+        epc = frame[7:7 + epc_len]
         
-        # Parse antenna
-        antenna = ((frame[i] - 1) % 4) + 1
+        # Parse RSSI and antenna
+        rssi_raw, ant_raw = _RSSI_ANT.unpack_from(frame, 7 + epc_len)
+        rssi = rssi_raw / 10.0
+        antenna = ((ant_raw - 1) % 4) + 1
         
         return {
             'epc': epc,
@@ -244,45 +386,39 @@ def main():
         cleanup_gpio()
         sys.exit(1)
     
-    # Start continuous inventory
+    # Start continuous inventory; FrameReader blocks until the first frame arrives
     start_continuous_inventory(serial_port)
-    time.sleep(0.5)
     
     # Main reading loop
-    buffer = b""
+    open_log()
+    reader = FrameReader(serial_port)
     
     logger.info("Reading active - Press Ctrl+C to stop")
     
     try:
         while running:
-            # Read available data
-            if serial_port.in_waiting:
-                buffer += serial_port.read(serial_port.in_waiting)
+            frame = reader.next_frame()
+            
+            # Timed out: push out whatever is still buffered
+            if frame is None:
+                flush_log(force=True)
+                continue
             
-            # Process complete frames
-            while b'\x0D\x0A' in buffer:
-                pos = buffer.find(b'\x0D\x0A')
-                
-                if pos < 10:
-                    buffer = buffer[pos + 2:]
-                    continue
-                
-                frame = buffer[:pos + 2]
-                buffer = buffer[pos + 2:]
-                
+            # Shorter frames are not inventory frames
+            if len(frame) >= 12:
                 # Parse and log reading
                 reading = parse_frame(frame)
                 if reading:
-                    # Filter: only log EPCs of expected length (adjust as needed)
-                    if len(reading['epc']) >= 8:
+                    # Filter: only log EPCs of expected length in bytes (adjust as needed)
+                    if len(reading['epc']) >= 4:
                         log_reading(
                             reading['epc'],
                             reading['antenna'],
                             reading['rssi']
                         )
             
-            # Small delay to prevent busy loop
-            time.sleep(0.01)
+            # Every frame, so a stream of non-reading frames can't hold records back
+            flush_log()
             
     except Exception as e:
         logger.error(f"Error in main loop: {e}")
@@ -294,11 +430,13 @@ def main():
         if serial_port:
             try:
                 stop_continuous_inventory(serial_port)
-                time.sleep(0.1)
+                # Wait for the stop frame to leave the UART rather than a fixed sleep
+                serial_port.flush()
                 serial_port.close()
             except Exception:
                 pass
         
+        close_log()
         cleanup_gpio()
         logger.info("Reader stopped")
 